@@ -1,11 +1,56 @@
 #!/usr/bin/env python3
 import argparse
-from os import walk, access, R_OK
-from os.path import expanduser, join, getsize, isfile, isdir, islink
+import re
+from os import walk, access, stat, lstat, major, minor, R_OK
+from os.path import expanduser, join, getsize, isdir, realpath, dirname, \
+    abspath
+from stat import S_ISREG
+from fnmatch import fnmatch
 from io import DEFAULT_BUFFER_SIZE
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from hashlib import md5
 from json import dumps
+import tarfile
+import zipfile
+import zlib
+
+
+# Default number of hashing workers for each kind of storage device:
+# solid-state disks handle many concurrent reads, rotational disks thrash
+# when they seek between files, network mounts sit in between.
+DEVICE_WORKERS = {'ssd': 8, 'rotational': 1, 'network': 4}
+
+# File system types that are served over the network.
+NETWORK_FILE_SYSTEMS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p',
+                        'ceph', 'glusterfs', 'fuse.sshfs', 'afs')
+
+# Extensions of the archives whose members can be scanned.
+ZIP_EXTENSIONS = ('.zip',)
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2',
+                  '.tar.xz', '.txz')
+
+# Separator between the path of an archive and the name of a member.
+ARCHIVE_SEPARATOR = '::'
+
+# Compression methods of zip members that can be read.
+ZIP_COMPRESS_TYPES = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED,
+                      zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA)
+
+# Errors raised when reading a corrupted or unsupported archive.
+ARCHIVE_ERRORS = (OSError, EOFError, zlib.error, zipfile.BadZipFile,
+                  tarfile.TarError, NotImplementedError)
+
+
+def compile_regex(pattern):
+    """ Compile a regex given on the command line """
+    try:
+        return re.compile(pattern)
+    except re.error as error:
+        raise argparse.ArgumentTypeError(
+            'invalid regex %r: %s' % (pattern, error))
 
 
 def take_args():
@@ -17,18 +62,56 @@ def take_args():
         populated namespace.
     """
     parser = argparse.ArgumentParser(description='Duplicate Files Finder')
-    parser.add_argument('-p', '--path', required=True,
-                        help='root directory')
+    parser.add_argument('-p', '--path', required=True, nargs='+',
+                        action='extend', help='root directories')
+    parser.add_argument('--exclude', nargs='+', action='extend', default=[],
+                        metavar='GLOB',
+                        help='skip files whose name or path match a glob')
+    parser.add_argument('--exclude-regex', nargs='+', action='extend',
+                        default=[], type=compile_regex, metavar='REGEX',
+                        help='skip files whose path match a regex')
+    parser.add_argument('--prune', nargs='+', action='extend', default=[],
+                        metavar='GLOB',
+                        help='skip directories whose name or path match a '
+                             'glob, with all their content')
+    parser.add_argument('--min-size', type=int, default=0,
+                        help='skip files smaller than this many bytes')
+    parser.add_argument('--max-size', type=int,
+                        help='skip files larger than this many bytes')
+    parser.add_argument('-a', '--archives', action='store_true',
+                        help='also scan the files inside zip and tar '
+                             'archives')
     parser.add_argument('-b', '--bonus', action='store_true')
     parser.add_argument('-hr', '--human-readable', action='store_true',
                         help='pretty print')
-    return parser.parse_args()
-
-
-def scan_files(path):
+    parser.add_argument('--ssd-workers', type=int,
+                        default=DEVICE_WORKERS['ssd'],
+                        help='hashing workers per solid-state device')
+    parser.add_argument('--hdd-workers', type=int,
+                        default=DEVICE_WORKERS['rotational'],
+                        help='hashing workers per rotational device')
+    parser.add_argument('--network-workers', type=int,
+                        default=DEVICE_WORKERS['network'],
+                        help='hashing workers per network mount')
+    args = parser.parse_args()
+    if args.min_size < 0:
+        parser.error('--min-size must not be negative')
+    if args.max_size is not None:
+        if args.max_size < 0:
+            parser.error('--max-size must not be negative')
+        if args.min_size > args.max_size:
+            parser.error('--min-size must not be greater than --max-size')
+    return args
+
+
+def scan_files(paths, excludes=(), exclude_regexes=(), prunes=(),
+               min_size=0, max_size=None, stats=None, archives=None):
     """ Waypoint2
-    Takes one argument path corresponding to an absolute path and
-    returns a flat list of files scanned recursively from this specified path
+    Takes one or several root paths and returns a flat list of files
+    scanned recursively from these specified paths. Filters are applied
+    during the traversal, so pruned directories are never walked and
+    excluded files are never stat'ed. Kept files are stat'ed once, and their
+    stat can be recorded so that it is not read again.
 
     Examples:
 
@@ -36,21 +119,62 @@ def scan_files(path):
         ['/home/botnet/downloads/heobs/archive.csv',
         '/home/botnet/downloads/heobs/GL0625.jpg',
         ...]
+        >>> scan_files(['~/downloads', '~/projects'],
+                       prunes=['node_modules', '.git'], min_size=1024)
+        ['/home/botnet/downloads/heobs/GL0625.jpg',
+        '/home/botnet/projects/heobs/GL0625.jpg',
+        ...]
+
 
+    @param paths: a root path, or a list of root paths
+    @param excludes: glob patterns of file names or paths to skip
+    @param exclude_regexes: regular expressions of file paths to skip
+    @param prunes: glob patterns of directory names or paths to skip
+    @param min_size: minimum size in bytes of the files to keep
+    @param max_size: maximum size in bytes of the files to keep, if any
+    @param stats: an optional dictionary to fill with the ``os.stat_result``
+        of every kept file
+    @param archives: an optional list to fill with the zip and tar archives
+        found, whatever their own size since the size bounds apply to their
+        members
 
     @return: a file list identified by its absolute path name.
     """
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        validate_path(path)
     all_files = []
-    validate_path(path)
-    for root, dirs, files in walk(path):
-        for file in files:
-            file_path = join(root, file)
-            if validate_file(file_path):
-                all_files.append(file_path)
+    # Roots may overlap, a file must only be listed once.
+    seen_files = set()
+    for path in paths:
+        for root, dirs, files in walk(path):
+            dirs[:] = [directory for directory in dirs
+                       if not match_patterns(directory, join(root, directory),
+                                             prunes)]
+            for file in files:
+                file_path = join(root, file)
+                if match_patterns(file, file_path, excludes, exclude_regexes):
+                    continue
+                if abspath(file_path) in seen_files:
+                    continue
+                file_stat = stat_valid_file(file_path)
+                if file_stat is None:
+                    continue
+                seen_files.add(abspath(file_path))
+                if stats is not None:
+                    stats[file_path] = file_stat
+                if archives is not None and (is_zip_archive(file_path)
+                                             or is_tar_archive(file_path)):
+                    archives.append(file_path)
+                if (file_stat.st_size >= min_size
+                        and (max_size is None
+                             or file_stat.st_size <= max_size)):
+                    all_files.append(file_path)
     return all_files
 
 
-def group_files_by_size(file_path_names):
+def group_files_by_size(file_path_names, stats=None):
     """ Waypoint3
     Returns a list of groups of at least two files
     that have the same size and ignore empty files
@@ -67,12 +191,14 @@ def group_files_by_size(file_path_names):
 
 
     @param file_path_names: list of absolute path files
+    @param stats: an optional dictionary of the stat of files, as filled by
+        ``scan_files``
 
     @return: list of groups of same size files
     """
     grouped_files = defaultdict(list)
     for file in file_path_names:
-        file_size = getsize(file)
+        file_size = get_file_size(file, stats)
         if file_size != 0:
             grouped_files[file_size].append(file)
     return [f_list for f_list in grouped_files.values() if len(f_list) > 1]
@@ -92,14 +218,19 @@ def get_file_checksum(file_path):
 
     @return: hash value of a file as string
     """
+    with open_file(file_path) as f:
+        return get_stream_checksum(f)
+
+
+def get_stream_checksum(f):
+    """ Generate the MD5 hash value of a binary stream read by chunk """
     file_hash = md5()
-    with open(file_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(DEFAULT_BUFFER_SIZE), b''):
-            file_hash.update(chunk)
+    for chunk in iter(lambda: f.read(DEFAULT_BUFFER_SIZE), b''):
+        file_hash.update(chunk)
     return file_hash.hexdigest()
 
 
-def group_files_by_checksum(file_path_names):
+def group_files_by_checksum(file_path_names, checksums=None):
     """ Waypoint5
     Group file with the same checksum into a list
 
@@ -115,17 +246,23 @@ def group_files_by_checksum(file_path_names):
 
 
     @param file_path_names: a list of file of the same size
+    @param checksums: an optional dictionary of already computed checksums
+        of these files, as returned by ``hash_files``
 
     @return: list of list of file of the same checksum
     """
+    if checksums is None:
+        checksums = hash_files(file_path_names)
     grouped_files_by_hash = defaultdict(list)
     for file in file_path_names:
-        grouped_files_by_hash[get_file_checksum(file)].append(file)
+        # Files that could not be read have no checksum.
+        if file in checksums:
+            grouped_files_by_hash[checksums[file]].append(file)
     return [f_list for f_list in grouped_files_by_hash.values()
             if len(f_list) > 1]
 
 
-def find_duplicate_files(file_path_names):
+def find_duplicate_files(file_path_names, workers=None, stats=None):
     """ Waypoint6
     Returns a list of groups of duplicate files
 
@@ -141,21 +278,476 @@ def find_duplicate_files(file_path_names):
 
 
     @param file_path_names: a list of file paths
+    @param workers: an optional dictionary of the number of hashing workers
+        per kind of device, see ``DEVICE_WORKERS``
+    @param stats: an optional dictionary of the stat of files, as filled by
+        ``scan_files``
 
     @return: list of list of file of the same content
     """
-    grouped_files_by_size = group_files_by_size(file_path_names)
+    grouped_files_by_size = [
+        crc_group
+        for file_group in group_files_by_size(file_path_names, stats)
+        for crc_group in group_members_by_crc(file_group)]
+    checksums = hash_files([file for file_group in grouped_files_by_size
+                            for file in file_group], workers, stats)
     duplicate_files = []
     for file_group in grouped_files_by_size:
-        for duplicate_file_group in group_files_by_checksum(file_group):
+        for duplicate_file_group in group_files_by_checksum(file_group,
+                                                            checksums):
             duplicate_files.append(duplicate_file_group)
     return duplicate_files
 
 
-def validate_file(file_path):
-    """ Check if path is a file and can be read and not a symlink """
-    return (isfile(file_path) and access(file_path, R_OK)
-            and not islink(file_path))
+"""-----------------ARCHIVES-----------------------------"""
+
+
+class ArchiveMember(str):
+    """
+    Path name of a file stored inside an archive, written as
+    ``archive::member``, that keeps what is needed to read the member
+    without extracting the archive
+    """
+
+    def __new__(cls, archive, name, size, crc=None):
+        member = super().__new__(cls, archive + ARCHIVE_SEPARATOR + name)
+        member.archive = archive
+        member.name = name
+        member.size = size
+        member.crc = crc
+        return member
+
+
+def is_zip_archive(file_path):
+    """ Check if path is named like a zip archive """
+    return file_path.lower().endswith(ZIP_EXTENSIONS)
+
+
+def is_tar_archive(file_path):
+    """ Check if path is named like a tar archive """
+    return file_path.lower().endswith(TAR_EXTENSIONS)
+
+
+def get_tar_mode(file_path):
+    """
+    Return the mode to read a tar with: a compressed tar cannot be seeked,
+    so stream mode decompresses it only once, while random access mode
+    skips over the data of the members of an uncompressed tar
+    """
+    if file_path.lower().endswith('.tar'):
+        return 'r:*'
+    return 'r|*'
+
+
+def scan_archive_members(file_path_names, excludes=(), exclude_regexes=(),
+                         prunes=(), min_size=0, max_size=None):
+    """
+    Returns a flat list of the files stored inside the zip and tar archives
+    of a file list, read from the archive index and never extracted. The
+    filters of ``scan_files`` apply to the members as if the archive was a
+    directory.
+
+    Example:
+
+        >>> scan_archive_members(['/home/botnet/downloads/heobs.zip',
+                                  '/home/botnet/downloads/heobs/GL0625.jpg'])
+        ['/home/botnet/downloads/heobs.zip::heobs/GL0625.jpg',
+        '/home/botnet/downloads/heobs.zip::heobs/GL0701.jpg',
+        ...]
+
+
+    @param file_path_names: list of absolute path files
+    @param excludes: glob patterns of member names or paths to skip
+    @param exclude_regexes: regular expressions of member paths to skip
+    @param prunes: glob patterns of directory names or paths to skip in
+        archives
+    @param min_size: minimum uncompressed size in bytes of the members to keep
+    @param max_size: maximum uncompressed size in bytes of the members to
+        keep, if any
+
+    @return: list of ``ArchiveMember``
+    """
+    members = []
+    for file in file_path_names:
+        # When a name is stored several times, the last entry is the one
+        # that is read by name, as ``tar -r`` appends the newer copy.
+        infos = {}
+        try:
+            if is_zip_archive(file):
+                with zipfile.ZipFile(file) as archive:
+                    for info in archive.infolist():
+                        infos[info.filename] = (
+                            info.file_size, info.CRC,
+                            # Encrypted members cannot be read.
+                            not info.is_dir() and not info.flag_bits & 1
+                            and info.compress_type in ZIP_COMPRESS_TYPES)
+            elif is_tar_archive(file):
+                with tarfile.open(file, get_tar_mode(file)) as archive:
+                    for info in archive:
+                        infos[info.name] = (info.size, None, info.isfile())
+            else:
+                continue
+        except ARCHIVE_ERRORS:
+            continue
+        for name, (size, crc, readable) in infos.items():
+            if (readable and size >= min_size
+                    and (max_size is None or size <= max_size)
+                    and not match_member_patterns(file, name, excludes,
+                                                  exclude_regexes, prunes)):
+                members.append(ArchiveMember(file, name, size, crc))
+    return members
+
+
+def match_member_patterns(archive, name, excludes=(), exclude_regexes=(),
+                          prunes=()):
+    """
+    Check if a member of an archive is excluded, or is inside a directory
+    of the archive that is pruned
+    """
+    parts = name.split('/')
+    for i in range(1, len(parts)):
+        directory_path = archive + ARCHIVE_SEPARATOR + '/'.join(parts[:i])
+        if match_patterns(parts[i - 1], directory_path, prunes):
+            return True
+    return match_patterns(parts[-1], archive + ARCHIVE_SEPARATOR + name,
+                          excludes, exclude_regexes)
+
+
+def group_members_by_crc(file_path_names):
+    """
+    Split a group of same size files using the CRC32 that zip archives
+    store for their members, which costs no read. The group is left as is
+    when some of its files have no known CRC32.
+
+    @param file_path_names: a list of file of the same size
+
+    @return: list of groups of at least two files that may be duplicates
+    """
+    if not all(isinstance(file, ArchiveMember) and file.crc is not None
+               for file in file_path_names):
+        return [file_path_names]
+    grouped_files = defaultdict(list)
+    for file in file_path_names:
+        grouped_files[file.crc].append(file)
+    return [f_list for f_list in grouped_files.values() if len(f_list) > 1]
+
+
+def split_archive_members(members, count):
+    """
+    Split the members of an archive into at most ``count`` lists that can be
+    hashed in parallel. A zip can be read at random so its members are
+    split, a tar is kept whole to be read in a single pass.
+
+    @param members: a list of members of a same archive
+    @param count: the number of lists to split a zip into
+
+    @return: list of lists of members
+    """
+    if not is_zip_archive(members[0].archive) or count <= 1:
+        return [members]
+    size = -(-len(members) // count)
+    return [members[i:i + size] for i in range(0, len(members), size)]
+
+
+def group_members_by_archive(file_path_names):
+    """
+    Group the archive members of a file list by their archive
+
+    @param file_path_names: a list of file paths
+
+    @return: dictionary of archive paths and their list of members
+    """
+    grouped_files = defaultdict(list)
+    for file in file_path_names:
+        if isinstance(file, ArchiveMember):
+            grouped_files[file.archive].append(file)
+    return grouped_files
+
+
+def get_file_size(file_path, stats=None):
+    """
+    Return the size of a file, from ``stats`` when it is already known, or
+    the uncompressed size of a member
+    """
+    if isinstance(file_path, ArchiveMember):
+        return file_path.size
+    if stats is not None and file_path in stats:
+        return stats[file_path].st_size
+    return getsize(file_path)
+
+
+@contextmanager
+def open_file(file_path):
+    """
+    Open a file, or stream-decompress a member from its archive, for
+    reading in binary mode
+    """
+    if not isinstance(file_path, ArchiveMember):
+        with open(file_path, 'rb') as f:
+            yield f
+    elif is_zip_archive(file_path.archive):
+        with zipfile.ZipFile(file_path.archive) as archive, \
+                archive.open(file_path.name) as f:
+            yield f
+    else:
+        with tarfile.open(file_path.archive, 'r:*') as archive:
+            yield archive.extractfile(file_path.name)
+
+
+def get_file_checksums(file_path_names):
+    """
+    Generate the checksum of several files. Members of a same archive are
+    hashed with the archive opened once: a zip index is read once, and a
+    compressed tar is decompressed in a single pass. Files or members that
+    cannot be read are left out, a tar that cannot be read is left out as a
+    whole.
+
+    @param file_path_names: a list of regular files, or a list of members
+        of a same archive
+
+    @return: dictionary of file paths and their hash value
+    """
+    members = {file.name: file for file in file_path_names
+               if isinstance(file, ArchiveMember)}
+    checksums = {}
+    if not members:
+        for file in file_path_names:
+            try:
+                checksums[file] = get_file_checksum(file)
+            except ARCHIVE_ERRORS:
+                continue
+        return checksums
+    archive_path = file_path_names[0].archive
+    if is_zip_archive(archive_path):
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                for member in file_path_names:
+                    try:
+                        with archive.open(member.name) as f:
+                            checksums[member] = get_stream_checksum(f)
+                    except ARCHIVE_ERRORS:
+                        continue
+        except ARCHIVE_ERRORS:
+            pass
+        return checksums
+    try:
+        with tarfile.open(archive_path, get_tar_mode(archive_path)) \
+                as archive:
+            for info in archive:
+                member = members.get(info.name)
+                if member is None:
+                    continue
+                # The last entry of a name overrides the previous ones.
+                checksums.pop(member, None)
+                if not info.isfile():
+                    continue
+                checksums[member] = get_stream_checksum(
+                    archive.extractfile(info))
+    except ARCHIVE_ERRORS:
+        return {}
+    return checksums
+
+
+"""-----------------DEVICES------------------------------"""
+
+
+def group_files_by_device(file_path_names, stats=None):
+    """
+    Group files by the device they are stored on, leaving out the files
+    that no longer exist
+
+    @param file_path_names: list of absolute path files
+    @param stats: an optional dictionary of the stat of files, as filled by
+        ``scan_files``
+
+    @return: dictionary of device numbers and their list of files
+    """
+    if stats is None:
+        stats = {}
+    grouped_files = defaultdict(list)
+    for file in file_path_names:
+        if isinstance(file, ArchiveMember):
+            path = file.archive
+        else:
+            path = file
+        if path not in stats:
+            try:
+                stats[path] = stat(path)
+            except OSError:
+                continue
+        grouped_files[stats[path].st_dev].append(file)
+    return grouped_files
+
+
+def parse_mountinfo_line(line):
+    """
+    Read the device number, the file system type and the source of a mount
+    from a line of ``/proc/self/mountinfo``
+
+    Example:
+
+        >>> parse_mountinfo_line('36 35 0:42 / /home rw - btrfs /dev/sda2 rw')
+        ((0, 42), 'btrfs', '/dev/sda2')
+
+
+    @return: a tuple of the device number as a ``(major, minor)`` tuple, the
+        file system type and the mount source
+    """
+    fields, _, fs_fields = line.partition(' - ')
+    dev_major, dev_minor = fields.split()[2].split(':')
+    fs_type, source = fs_fields.split()[:2]
+    return (int(dev_major), int(dev_minor)), fs_type, source
+
+
+def get_mounted_file_systems():
+    """
+    Read the file system type and the source of every mounted device
+
+    @return: dictionary of device numbers and their file system type and
+        mount source
+    """
+    file_systems = {}
+    try:
+        with open('/proc/self/mountinfo') as f:
+            for line in f:
+                dev_id, fs_type, source = parse_mountinfo_line(line)
+                file_systems[dev_id] = (fs_type, source)
+    except (OSError, ValueError, IndexError):
+        pass
+    return file_systems
+
+
+def get_block_device_kind(dev_id):
+    """
+    Read whether a block device is rotational from sysfs
+
+    @param dev_id: a device number as a ``(major, minor)`` tuple
+
+    @return: ``'rotational'``, ``'ssd'``, or ``None`` if it is unknown
+    """
+    # A partition has no queue of its own, it uses the one of its disk.
+    sys_path = realpath('/sys/dev/block/%d:%d' % dev_id)
+    for path in (sys_path, dirname(sys_path)):
+        try:
+            with open(join(path, 'queue', 'rotational')) as f:
+                if f.read().strip() == '1':
+                    return 'rotational'
+                return 'ssd'
+        except OSError:
+            continue
+    return None
+
+
+def get_device_kind(device, file_systems=None):
+    """
+    Tell whether a device is a network mount, a rotational disk or a
+    solid-state disk. File systems such as btrfs report an anonymous device
+    number, so their kind is read from the block device they are mounted
+    from. A device whose kind is still unknown is treated as rotational,
+    since a single reader is slow on a solid-state disk but many readers
+    thrash a rotational one.
+
+    Example:
+
+        >>> get_device_kind(os.stat('/home/botnet').st_dev)
+        'ssd'
+
+
+    @param device: a device number, as ``st_dev``
+    @param file_systems: an optional dictionary as returned by
+        ``get_mounted_file_systems``
+
+    @return: one of the keys of ``DEVICE_WORKERS``
+    """
+    if file_systems is None:
+        file_systems = get_mounted_file_systems()
+    dev_id = (major(device), minor(device))
+    fs_type, source = file_systems.get(dev_id, ('', ''))
+    if fs_type in NETWORK_FILE_SYSTEMS:
+        return 'network'
+    kind = get_block_device_kind(dev_id)
+    if kind is None and source.startswith('/dev/'):
+        try:
+            source_device = stat(source).st_rdev
+        except OSError:
+            pass
+        else:
+            kind = get_block_device_kind((major(source_device),
+                                          minor(source_device)))
+    return kind or 'rotational'
+
+
+def hash_files(file_path_names, workers=None, stats=None):
+    """
+    Generate the checksum of files, running a separate worker pool for each
+    device so that every device is kept busy at the same time
+
+    Example:
+
+        >>> hash_files(['/home/botnet/downloads/heobs/GL0625.jpg'])
+        {'/home/botnet/downloads/heobs/GL0625.jpg':
+        'dd23819ce306f0f1476522c9ce3e0a07'}
+
+
+    @param file_path_names: a list of file paths
+    @param workers: an optional dictionary of the number of hashing workers
+        per kind of device, see ``DEVICE_WORKERS``
+    @param stats: an optional dictionary of the stat of files, as filled by
+        ``scan_files``
+
+    @return: dictionary of file paths and their hash value
+    """
+    workers = dict(DEVICE_WORKERS, **(workers or {}))
+    file_systems = get_mounted_file_systems()
+    pools = []
+    results = []
+    try:
+        for device, files in group_files_by_device(file_path_names,
+                                                    stats).items():
+            kind = get_device_kind(device, file_systems)
+            pool_size = max(1, workers[kind])
+            pool = ThreadPoolExecutor(max_workers=pool_size)
+            pools.append(pool)
+            regular_files = [file for file in files
+                             if not isinstance(file, ArchiveMember)]
+            results.extend(pool.submit(get_file_checksums, [file])
+                           for file in regular_files)
+            results.extend(pool.submit(get_file_checksums, chunk)
+                           for members in
+                           group_members_by_archive(files).values()
+                           for chunk in split_archive_members(members,
+                                                              pool_size))
+        return {file: checksum
+                for future in results
+                for file, checksum in future.result().items()}
+    finally:
+        for pool in pools:
+            pool.shutdown(cancel_futures=True)
+
+
+def stat_valid_file(file_path, min_size=0, max_size=None):
+    """
+    Check with a single ``lstat`` if path is a regular file, not a symlink,
+    that can be read and whose size is within the given bounds
+
+    @return: the ``os.stat_result`` of the file, or ``None`` if it is not
+        valid
+    """
+    try:
+        file_stat = lstat(file_path)
+    except OSError:
+        return None
+    if (S_ISREG(file_stat.st_mode) and file_stat.st_size >= min_size
+            and (max_size is None or file_stat.st_size <= max_size)
+            and access(file_path, R_OK)):
+        return file_stat
+    return None
+
+
+def match_patterns(name, path, globs=(), regexes=()):
+    """ Check if a name or path match any of the globs or regexes """
+    return (any(fnmatch(name, glob) or fnmatch(path, glob) for glob in globs)
+            or any(re.search(regex, path) for regex in regexes))
 
 
 def validate_path(path):
@@ -197,19 +789,23 @@ def bonus_group_file(file_names):
 
 def file_compare(file_name1, file_name2):
     """
-    Divide file content by chunk and compare them together
+    Divide file content by chunk and compare them together, a file that
+    cannot be read is not the same as any other
     """
-    with open(file_name1, 'rb') as file1, open(file_name2, 'rb') as file2:
-        while True:
-            file1_chunk = file1.read(DEFAULT_BUFFER_SIZE)
-            file2_chunk = file2.read(DEFAULT_BUFFER_SIZE)
-            if file1_chunk != file2_chunk:
-                return False
-            if not file1_chunk:
-                return True
-
-
-def bonus_find_duplicate_files(file_path_names):
+    try:
+        with open_file(file_name1) as file1, open_file(file_name2) as file2:
+            while True:
+                file1_chunk = file1.read(DEFAULT_BUFFER_SIZE)
+                file2_chunk = file2.read(DEFAULT_BUFFER_SIZE)
+                if file1_chunk != file2_chunk:
+                    return False
+                if not file1_chunk:
+                    return True
+    except ARCHIVE_ERRORS:
+        return False
+
+
+def bonus_find_duplicate_files(file_path_names, stats=None):
     """ Waypoint6
     Returns a list of groups of duplicate files
 
@@ -225,10 +821,15 @@ def bonus_find_duplicate_files(file_path_names):
 
 
     @param file_path_names: a list of file paths
+    @param stats: an optional dictionary of the stat of files, as filled by
+        ``scan_files``
 
     @return: list of list of file of the same content
     """
-    grouped_files_by_size = group_files_by_size(file_path_names)
+    grouped_files_by_size = [
+        crc_group
+        for file_group in group_files_by_size(file_path_names, stats)
+        for crc_group in group_members_by_crc(file_group)]
     duplicate_files = []
     for file_group in grouped_files_by_size:
         for duplicate_file_group in bonus_group_file(file_group):
@@ -241,11 +842,25 @@ def bonus_find_duplicate_files(file_path_names):
 
 def main():
     args = take_args()
-    files = scan_files(args.path)
+    stats = {}
+    archives = [] if args.archives else None
+    files = scan_files(args.path, args.exclude, args.exclude_regex,
+                       args.prune, args.min_size, args.max_size, stats,
+                       archives)
+    if args.archives:
+        files += scan_archive_members(archives, args.exclude,
+                                      args.exclude_regex, args.prune,
+                                      args.min_size, args.max_size)
     if args.bonus:
-        pretty_print(bonus_find_duplicate_files, files, args.human_readable)
+        pretty_print(partial(bonus_find_duplicate_files, stats=stats),
+                     files, args.human_readable)
     else:
-        pretty_print(find_duplicate_files, files, args.human_readable)
+        workers = {'ssd': args.ssd_workers,
+                   'rotational': args.hdd_workers,
+                   'network': args.network_workers}
+        pretty_print(partial(find_duplicate_files, workers=workers,
+                             stats=stats),
+                     files, args.human_readable)
 
 
 if __name__ == '__main__':
@@ -1,9 +1,15 @@
 import unittest
-from os import getcwd, remove, chmod
+from os import getcwd, remove, chmod, makedev
 from os.path import join
 import find_duplicate_files as fdf
 from subprocess import Popen, PIPE, run
 from json import loads
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, Mock
+from tempfile import TemporaryDirectory
+from io import BytesIO
+import tarfile
+import zipfile
 
 
 class TestFindDuplicateFiles(unittest.TestCase):
@@ -64,3 +70,243 @@ class TestFindDuplicateFiles(unittest.TestCase):
         self.assertIn(set(self.duplicate_files), result)
         # check if empty file not in result
         self.assertNotIn(set(add_file), result)
+
+    def test_hash_files(self):
+        checksums = fdf.hash_files(self.duplicate_files,
+                                   {'ssd': 2, 'rotational': 1, 'network': 1})
+        # every file is hashed once with the same result as a single read
+        self.assertEqual(set(checksums), set(self.duplicate_files))
+        for file in self.duplicate_files:
+            self.assertEqual(checksums[file], fdf.get_file_checksum(file))
+
+    def test_get_device_kind(self):
+        device = makedev(0, 4242)
+        file_systems = {(0, 4242): ('nfs', 'server:/export')}
+        self.assertEqual(fdf.get_device_kind(device, file_systems),
+                         'network')
+        # a device whose kind cannot be found gets the conservative pool
+        file_systems = {(0, 4242): ('tmpfs', 'tmpfs')}
+        self.assertEqual(fdf.get_device_kind(device, file_systems),
+                         'rotational')
+        # btrfs has an anonymous device, its kind is read from its source
+        file_systems = {(0, 4242): ('btrfs', '/dev/nvme0n1p2')}
+        block_device_kinds = {(0, 4242): None, (259, 2): 'ssd'}
+        with patch.object(fdf, 'stat',
+                          return_value=Mock(st_rdev=makedev(259, 2))), \
+                patch.object(fdf, 'get_block_device_kind',
+                             side_effect=block_device_kinds.get):
+            self.assertEqual(fdf.get_device_kind(device, file_systems),
+                             'ssd')
+            fdf.stat.assert_called_once_with('/dev/nvme0n1p2')
+
+    def test_parse_mountinfo_line(self):
+        line = ('36 35 0:42 /@home /home rw,relatime shared:1 - '
+                'btrfs /dev/sda2 rw,ssd,subvol=/@home\n')
+        self.assertEqual(fdf.parse_mountinfo_line(line),
+                         ((0, 42), 'btrfs', '/dev/sda2'))
+
+    def test_hash_files_pool_sizes(self):
+        pool_sizes = []
+
+        def thread_pool_executor(max_workers):
+            pool_sizes.append(max_workers)
+            return ThreadPoolExecutor(max_workers=max_workers)
+
+        with patch.object(fdf, 'ThreadPoolExecutor', thread_pool_executor), \
+                patch.object(fdf, 'get_device_kind',
+                             return_value='network'):
+            fdf.hash_files(self.duplicate_files, {'network': 3})
+        self.assertEqual(pool_sizes, [3])
+
+    def test_hash_files_missing_file(self):
+        # a file removed after the scan is left out instead of failing
+        missing_file = join('testcase', 'missing_file')
+        self.assertEqual(fdf.group_files_by_device([missing_file]), {})
+        checksums = fdf.hash_files(self.duplicate_files + [missing_file])
+        self.assertEqual(set(checksums), set(self.duplicate_files))
+
+    def test_scan_files_filters(self):
+        root = 'testcase/symlink_test/'
+        # several roots are scanned, overlapping files are listed once
+        result = fdf.scan_files(['testcase/symlink_test', 'testcase'])
+        self.assertEqual(result.count(root + 'symlink'), 1)
+        self.assertIn('testcase/empty_file1', result)
+        # excluded files and pruned directories are skipped
+        result = fdf.scan_files('testcase', excludes=['empty_*'])
+        self.assertNotIn('testcase/empty_file1', result)
+        self.assertIn(root + 'symlink', result)
+        result = fdf.scan_files('testcase', exclude_regexes=['_file[0-9]$'])
+        self.assertEqual(result, [root + 'symlink'])
+        result = fdf.scan_files('testcase', prunes=['symlink_test'])
+        self.assertNotIn(root + 'symlink', result)
+        # files out of the size bounds are skipped
+        self.assertEqual(fdf.scan_files('testcase', min_size=1),
+                         [root + 'symlink'])
+        self.assertNotIn(root + 'symlink',
+                         fdf.scan_files('testcase', max_size=17))
+        # stats read during the scan are reused when grouping the files
+        stats = {}
+        result = fdf.scan_files('testcase', stats=stats)
+        self.assertEqual(stats[root + 'symlink'].st_size, 18)
+        with patch.object(fdf, 'getsize') as getsize, \
+                patch.object(fdf, 'stat') as stat:
+            fdf.group_files_by_size(result, stats)
+            fdf.group_files_by_device(result, stats)
+        getsize.assert_not_called()
+        stat.assert_not_called()
+
+    def test_take_args_errors(self):
+        for argv in (['--exclude-regex', '('], ['--min-size', '-1'],
+                     ['--max-size', '-1'],
+                     ['--min-size', '10', '--max-size', '5']):
+            with patch('sys.argv', ['prog', '-p', 'testcase'] + argv), \
+                    patch('sys.stderr'), \
+                    self.assertRaises(SystemExit) as context:
+                fdf.take_args()
+            self.assertEqual(context.exception.code, 2)
+
+    def test_find_duplicate_archive_members(self):
+        with TemporaryDirectory() as tmp_dir:
+            regular_file = join(tmp_dir, 'regular')
+            with open(regular_file, 'wb') as f:
+                f.write(b'same content')
+            zip_path = join(tmp_dir, 'bundle.zip')
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('dir/copy', b'same content')
+                zf.writestr('other', b'diff content')
+            tar_path = join(tmp_dir, 'bundle.tar.gz')
+            with tarfile.open(tar_path, 'w:gz') as tf:
+                tf.add(regular_file, 'copy')
+            files = fdf.scan_files(tmp_dir)
+            members = fdf.scan_archive_members(files)
+            # members are listed with their uncompressed size
+            self.assertEqual(set(members), {zip_path + '::dir/copy',
+                                            zip_path + '::other',
+                                            tar_path + '::copy'})
+            self.assertEqual({fdf.get_file_size(m) for m in members}, {12})
+            result = fdf.find_duplicate_files(files + members)
+            self.assertEqual([set(group) for group in result],
+                             [{regular_file, zip_path + '::dir/copy',
+                               tar_path + '::copy'}])
+            result = fdf.bonus_find_duplicate_files(files + members)
+            self.assertEqual([set(group) for group in result],
+                             [{regular_file, zip_path + '::dir/copy',
+                               tar_path + '::copy'}])
+            # zip members with different CRC32 are never read
+            zip_members = [m for m in members if m.archive == zip_path]
+            self.assertEqual(fdf.group_members_by_crc(zip_members), [])
+
+    def test_find_duplicate_bad_archive_members(self):
+        with TemporaryDirectory() as tmp_dir:
+            regular_file = join(tmp_dir, 'regular')
+            with open(regular_file, 'wb') as f:
+                f.write(b'hello world!')
+            # a member whose data does not match its CRC32
+            corrupt_path = join(tmp_dir, 'corrupt.zip')
+            with zipfile.ZipFile(corrupt_path, 'w') as zf:
+                zf.writestr('y', b'hello world!')
+            with open(corrupt_path, 'rb') as f:
+                data = f.read()
+            with open(corrupt_path, 'wb') as f:
+                f.write(data.replace(b'hello world!', b'hello world?'))
+            # a member compressed with deflate64, which cannot be read
+            deflate64_path = join(tmp_dir, 'deflate64.zip')
+            with zipfile.ZipFile(deflate64_path, 'w') as zf:
+                zf.writestr('z', b'hello world!')
+            with open(deflate64_path, 'rb') as f:
+                data = bytearray(f.read())
+            data[8:10] = (9).to_bytes(2, 'little')
+            central_directory = data.index(b'PK\x01\x02')
+            data[central_directory + 10:central_directory + 12] = \
+                (9).to_bytes(2, 'little')
+            with open(deflate64_path, 'wb') as f:
+                f.write(data)
+            files = fdf.scan_files(tmp_dir)
+            members = fdf.scan_archive_members(files)
+            self.assertEqual(members, [corrupt_path + '::y'])
+            # the corrupt member is left out instead of aborting the run
+            self.assertEqual(fdf.hash_files(members), {})
+            self.assertEqual(fdf.find_duplicate_files(files + members), [])
+            self.assertEqual(
+                fdf.bonus_find_duplicate_files(files + members), [])
+
+    def test_find_duplicate_repeated_archive_members(self):
+        with TemporaryDirectory() as tmp_dir:
+            regular_file = join(tmp_dir, 'regular')
+            with open(regular_file, 'wb') as f:
+                f.write(b'hello world!')
+            zip_path = join(tmp_dir, 'bundle.zip')
+            with zipfile.ZipFile(zip_path, 'w') as zf, \
+                    patch('warnings.warn'):
+                zf.writestr('x', b'old')
+                zf.writestr('x', b'hello world!')
+            tar_path = join(tmp_dir, 'bundle.tar.gz')
+            with tarfile.open(tar_path, 'w:gz') as tf:
+                for content in (b'old', b'hello world!'):
+                    info = tarfile.TarInfo('x')
+                    info.size = len(content)
+                    tf.addfile(info, BytesIO(content))
+            files = fdf.scan_files(tmp_dir)
+            members = fdf.scan_archive_members(files)
+            # the last entry of a name is the one kept and read
+            self.assertEqual(sorted(members),
+                             [tar_path + '::x', zip_path + '::x'])
+            expected = [{regular_file, zip_path + '::x', tar_path + '::x'}]
+            result = fdf.find_duplicate_files(files + members)
+            self.assertEqual([set(group) for group in result], expected)
+            result = fdf.bonus_find_duplicate_files(files + members)
+            self.assertEqual([set(group) for group in result], expected)
+
+    def test_hash_zip_members_once(self):
+        with TemporaryDirectory() as tmp_dir:
+            zip_path = join(tmp_dir, 'bundle.zip')
+            with zipfile.ZipFile(zip_path, 'w') as zf:
+                for name in 'abcd':
+                    zf.writestr(name, b'same content')
+            members = fdf.scan_archive_members([zip_path])
+            # the zip index is read once for all its members
+            with patch.object(zipfile, 'ZipFile',
+                              wraps=zipfile.ZipFile) as zip_file:
+                checksums = fdf.get_file_checksums(members)
+            self.assertEqual(zip_file.call_count, 1)
+            self.assertEqual(len(set(checksums.values())), 1)
+            self.assertEqual(set(checksums), set(members))
+            # zip members are split to be hashed in parallel, not tar ones
+            self.assertEqual(fdf.split_archive_members(members, 3),
+                             [members[:2], members[2:]])
+            self.assertEqual(fdf.split_archive_members(members, 1),
+                             [members])
+            tar_members = [fdf.ArchiveMember('bundle.tar', name, 12)
+                           for name in 'abcd']
+            self.assertEqual(fdf.split_archive_members(tar_members, 3),
+                             [tar_members])
+
+    def test_scan_archive_members_filters(self):
+        with TemporaryDirectory() as tmp_dir:
+            regular_file = join(tmp_dir, 'regular')
+            with open(regular_file, 'wb') as f:
+                f.write(b'hello world!')
+            zip_path = join(tmp_dir, 'big.zip')
+            with zipfile.ZipFile(zip_path, 'w') as zf:
+                zf.writestr('copy', b'hello world!')
+                zf.writestr('padding', bytes(range(256)) * 20)
+                zf.writestr('node_modules/x', b'hello world!')
+                zf.writestr('lib/skip.js', b'hello world!')
+                zf.writestr('lib/skip.min', b'hello world!')
+            # an archive is scanned whatever its own size
+            archives = []
+            files = fdf.scan_files(tmp_dir, max_size=100, archives=archives)
+            self.assertEqual(files, [regular_file])
+            self.assertEqual(archives, [zip_path])
+            # size bounds apply to the members
+            members = fdf.scan_archive_members(archives, max_size=100)
+            self.assertNotIn(zip_path + '::padding', members)
+            self.assertIn(zip_path + '::copy', members)
+            # prune and exclude rules apply to the member paths
+            members = fdf.scan_archive_members(
+                archives, excludes=['*.js'], exclude_regexes=[r'\.min$'],
+                prunes=['node_modules'], max_size=100)
+            self.assertEqual(members, [zip_path + '::copy'])
+            result = fdf.find_duplicate_files(files + members)
+            self.assertEqual([set(group) for group in result],
+                             [{regular_file, zip_path + '::copy'}])